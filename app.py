@@ -2,16 +2,24 @@
 # ---------------------------------
 # - /render/triad: gera SVG/PNG/ASCII de tríades (maj/min/dim/aug),
 #   com inversões, drop2/drop3, grupo de cordas, start_fret e destaque de escala.
+# - /render/triads/batch: várias tríades (SVG/ASCII) numa só requisição.
 # - Swagger com botão 🔒 Authorize (HTTP Bearer).
 # - CORS liberado (ajuste origins para produção).
+# - Compressão gzip das respostas (>= 512 bytes).
 # - PNG opcional via CairoSVG.
+# - Cache LRU em memória das respostas de /render/triad.
 
+import hmac
 import os
-from typing import Optional, Tuple
+from functools import lru_cache
+from typing import List, Optional, Tuple, Union
 
 from fastapi import FastAPI, HTTPException, Header, Response
+from fastapi.responses import ORJSONResponse
 from fastapi.middleware.cors import CORSMiddleware
-from pydantic import BaseModel, Field
+from fastapi.middleware.gzip import GZipMiddleware
+from starlette.concurrency import run_in_threadpool
+from pydantic import BaseModel, ConfigDict, Field, field_validator
 
 # Swagger security (para exibir o botão "Authorize")
 from fastapi.security import HTTPBearer
@@ -23,18 +31,28 @@ from tgl_core import (
     generate_tetrad_voicing,   # <--- novo
     render_svg_fretboard,
     render_ascii_grid,
+    sorted_strings,
     MODES,
     QUALITY_INTERVALS,
+    TETRAD_INTERVALS,
 )
 
+# PNG opcional (sem a lib nativa do cairo o import levanta OSError)
+try:
+    import cairosvg
+except Exception:
+    cairosvg = None
+
 # -------- Config --------
 API_KEY = os.getenv("RENDER_API_KEY", "changeme")
+_API_KEY_B = API_KEY.encode("utf-8")
 
 security = HTTPBearer()
 
 app = FastAPI(
     title="TGL Render API",
     version="1.0.0",
+    default_response_class=ORJSONResponse,
     openapi_tags=[{"name": "default", "description": "Render triads and chords"}],
 )
 
@@ -47,6 +65,9 @@ app.add_middleware(
     allow_headers=["*"],
 )
 
+# gzip para SVG/JSON (texto bem compressível); PNG quase não ganha
+app.add_middleware(GZipMiddleware, minimum_size=512)
+
 # -------- OpenAPI com esquema de segurança (mostra 🔒 Authorize) --------
 def custom_openapi():
     if app.openapi_schema:
@@ -71,20 +92,15 @@ app.openapi = custom_openapi
 
 
 # -------- Models --------
+def _check_strings(strings: Tuple[int, ...]) -> Tuple[int, ...]:
+    sorted_strings(strings)  # ValueError para cordas repetidas/fora de 1..6
+    return strings
+
+
 class TriadPayload(BaseModel):
-    class TetradPayload(BaseModel):
-    root: str = Field("C")
-    quality: str = Field("maj7", description="maj7|min7|7|m7b5|dim7")
-    strings: Tuple[int,int,int,int] = Field((1,2,3,4), description="4 cordas (topo→base)")
-    inversion: int = Field(0, ge=0, le=3)
-    spread: Optional[str] = Field(None, description="None|drop2|drop3")
-    start_fret: int = Field(0, ge=0, le=18)
-    scale_mode: Optional[str] = None
-    highlight_scale: bool = True
-    show_all_scale: bool = False
-    output: str = Field("svg", description="svg|png|ascii")
-    width: int = 420
-    height: int = 520
+    # frozen → hashável, usado direto como chave do cache de render
+    model_config = ConfigDict(frozen=True, extra="forbid")
+
     root: str = Field("C", description="Tônica: C, C#, D, ... (sustenidos preferidos)")
     quality: str = Field("maj", description="maj|min|dim|aug")
     strings: Tuple[int, int, int] = Field(
@@ -104,97 +120,172 @@ class TriadPayload(BaseModel):
     width: int = Field(420, description="Largura SVG/PNG em px")
     height: int = Field(520, description="Altura SVG/PNG em px")
 
+    _strings_ok = field_validator("strings")(_check_strings)
+
+
+class TetradPayload(BaseModel):
+    root: str = Field("C")
+    quality: str = Field("maj7", description="maj7|min7|7|m7b5|dim7")
+    strings: Tuple[int,int,int,int] = Field((1,2,3,4), description="4 cordas (topo→base)")
+    inversion: int = Field(0, ge=0, le=3)
+    spread: Optional[str] = Field(None, description="None|drop2|drop3")
+    start_fret: int = Field(0, ge=0, le=18)
+    scale_mode: Optional[str] = None
+    highlight_scale: bool = True
+    show_all_scale: bool = False
+    output: str = Field("svg", description="svg|png|ascii")
+    width: int = 420
+    height: int = 520
+
+    _strings_ok = field_validator("strings")(_check_strings)
+
+
+class BatchPayload(BaseModel):
+    items: List[TriadPayload] = Field(..., min_length=1, max_length=100, description="Tríades (svg|ascii)")
+
 
 # -------- Auth helper --------
 def check_auth(auth: Optional[str]):
     if not auth or not auth.startswith("Bearer "):
         raise HTTPException(401, "Missing Authorization header")
-    token = auth.split(" ", 1)[1].strip()
-    if token != API_KEY:
+    token = auth[7:].strip().encode("utf-8")
+    # comparação em tempo constante
+    if not hmac.compare_digest(token, _API_KEY_B):
         raise HTTPException(403, "Invalid API key")
 
 
-# -------- Routes --------
-
-@app.get("/health/auth", tags=["default"])
-def health_auth():
-    key = API_KEY or ""
-    masked = (key[:1] + "*"*(len(key)-2) + key[-1:]) if key else ""
-    return {"ok": True, "env_var_present": bool(key), "key_length": len(key), "preview": masked}
-    
-@app.post("/render/triad", tags=["default"])
-def render_triad(payload: TriadPayload, Authorization: Optional[str] = Header(None)):
-    @app.post("/render/tetrad", tags=["default"])
-def render_tetrad(payload: TetradPayload, Authorization: Optional[str] = Header(None)):
-    check_auth(Authorization)
-
+# -------- Cache de render --------
+# A renderização é determinística no payload: a chave é o próprio TriadPayload
+# (frozen) em forma canônica (strings ordenadas, None→"", width/height zerados
+# no ASCII) e o valor é (media_type, conteúdo). PNG compartilha a entrada do
+# SVG; a rasterização tem cache próprio em _svg_to_png.
+def _canonical_payload(payload: TriadPayload) -> TriadPayload:
+    is_ascii = payload.output == "ascii"
+    return payload.model_copy(update={
+        "strings": sorted_strings(payload.strings),
+        "spread": payload.spread or "",
+        "scale_mode": payload.scale_mode or "",
+        "output": "svg" if payload.output == "png" else payload.output,
+        "width": 0 if is_ascii else payload.width,
+        "height": 0 if is_ascii else payload.height,
+    })
+
+
+@lru_cache(maxsize=4096)
+def _render_cached(payload: TriadPayload) -> Tuple[str, Union[str, bytes]]:
+    # validações simples
+    if payload.quality not in QUALITY_INTERVALS:
+        raise HTTPException(400, "quality deve ser: maj|min|dim|aug")
     if payload.scale_mode and payload.scale_mode not in MODES:
         raise HTTPException(400, f"scale_mode inválido. Use: {', '.join(MODES.keys())}")
 
+    # gerar voicing
     try:
-        voicing = generate_tetrad_voicing(
+        voicing = generate_triad_voicing(
             root=payload.root,
             quality=payload.quality,
             strings=payload.strings,
             inversion=payload.inversion,
-            spread=payload.spread,
+            spread=payload.spread or None,
             start_fret=payload.start_fret,
         )
     except ValueError as e:
         raise HTTPException(422, str(e))
 
+    return _render_voicing(voicing, payload)
+
+
+# -------- Render compartilhado (tríades e tétrades) --------
+def _render_voicing(voicing, payload) -> Tuple[str, Union[str, bytes]]:
+    # ASCII
     if payload.output == "ascii":
         ascii_text = render_ascii_grid(
             voicing=voicing,
             start_fret=payload.start_fret,
             chord_root=payload.root,
             quality=payload.quality,
-            scale_mode=payload.scale_mode,
+            scale_mode=payload.scale_mode or None,
             highlight_scale=payload.highlight_scale,
             show_all_scale=payload.show_all_scale,
         )
-        return {"ok": True, "content_type": "text/plain", "ascii": ascii_text}
+        return "text/plain", ascii_text
 
+    # SVG (também base do PNG)
     svg = render_svg_fretboard(
         voicing=voicing,
         start_fret=payload.start_fret,
         chord_root=payload.root,
         quality=payload.quality,
-        scale_mode=payload.scale_mode,
+        scale_mode=payload.scale_mode or None,
         highlight_scale=payload.highlight_scale,
         show_all_scale=payload.show_all_scale,
         width=payload.width,
         height=payload.height,
     )
 
-    if payload.output == "svg":
-        return Response(content=svg, media_type="image/svg+xml")
+    if payload.output not in ("svg", "png"):
+        raise HTTPException(400, "output inválido. Use: svg|png|ascii")
+    return "image/svg+xml", svg
 
+
+# O PNG volta como bytes (não StreamingResponse/write_to): o svg2png só termina
+# após codificar a imagem inteira, então não há o que transmitir antes, e os
+# bytes prontos são o que o cache guarda para as próximas requisições.
+@lru_cache(maxsize=256)
+def _svg_to_png(svg_bytes: bytes, width: int, height: int) -> bytes:
+    return cairosvg.svg2png(
+        bytestring=svg_bytes,
+        output_width=width,
+        output_height=height,
+    )
+
+
+async def _png_response(svg: bytes, width: int, height: int) -> Response:
+    if cairosvg is None:
+        raise HTTPException(500, "PNG requer CairoSVG. Instale com: pip install cairosvg")
+    # CairoSVG bloqueia: roda no threadpool para não travar o event loop
+    png_bytes = await run_in_threadpool(_svg_to_png, svg, width, height)
+    return Response(content=png_bytes, media_type="image/png")
+
+
+async def _respond(media_type: str, content: Union[str, bytes], payload):
+    if media_type == "text/plain":
+        # retorna JSON para facilitar consumo em apps
+        return {"ok": True, "content_type": "text/plain", "ascii": content}
     if payload.output == "png":
-        try:
-            import cairosvg
-        except Exception:
-            raise HTTPException(500, "PNG requer CairoSVG")
-        png_bytes = cairosvg.svg2png(
-            bytestring=svg.encode("utf-8"),
-            output_width=payload.width,
-            output_height=payload.height,
-        )
-        return Response(content=png_bytes, media_type="image/png")
+        return await _png_response(content, payload.width, payload.height)
+    return Response(content=content, media_type=media_type)
+
+
+# -------- Routes --------
+
+@app.get("/health/auth", tags=["default"])
+def health_auth():
+    key = API_KEY or ""
+    masked = (key[:1] + "*"*(len(key)-2) + key[-1:]) if key else ""
+    return {"ok": True, "env_var_present": bool(key), "key_length": len(key), "preview": masked}
 
-    raise HTTPException(400, "output inválido. Use: svg|png|ascii")
+
+@app.post("/render/triad", tags=["default"])
+async def render_triad(payload: TriadPayload, Authorization: Optional[str] = Header(None)):
     # auth
     check_auth(Authorization)
 
-    # validações simples
-    if payload.quality not in QUALITY_INTERVALS:
-        raise HTTPException(400, "quality deve ser: maj|min|dim|aug")
+    media_type, content = _render_cached(_canonical_payload(payload))
+    return await _respond(media_type, content, payload)
+
+
+@app.post("/render/tetrad", tags=["default"])
+async def render_tetrad(payload: TetradPayload, Authorization: Optional[str] = Header(None)):
+    check_auth(Authorization)
+
+    if payload.quality not in TETRAD_INTERVALS:
+        raise HTTPException(400, "quality deve ser: maj7|min7|7|m7b5|dim7")
     if payload.scale_mode and payload.scale_mode not in MODES:
         raise HTTPException(400, f"scale_mode inválido. Use: {', '.join(MODES.keys())}")
 
-    # gerar voicing
     try:
-        voicing = generate_triad_voicing(
+        voicing = generate_tetrad_voicing(
             root=payload.root,
             quality=payload.quality,
             strings=payload.strings,
@@ -205,49 +296,24 @@ def render_tetrad(payload: TetradPayload, Authorization: Optional[str] = Header(
     except ValueError as e:
         raise HTTPException(422, str(e))
 
-    # ASCII
-    if payload.output == "ascii":
-        ascii_text = render_ascii_grid(
-            voicing=voicing,
-            start_fret=payload.start_fret,
-            chord_root=payload.root,
-            quality=payload.quality,
-            scale_mode=payload.scale_mode,
-            highlight_scale=payload.highlight_scale,
-            show_all_scale=payload.show_all_scale,
-        )
-        # retorna JSON para facilitar consumo em apps
-        return {"ok": True, "content_type": "text/plain", "ascii": ascii_text}
+    media_type, content = _render_voicing(voicing, payload)
+    return await _respond(media_type, content, payload)
 
-    # SVG
-    svg = render_svg_fretboard(
-        voicing=voicing,
-        start_fret=payload.start_fret,
-        chord_root=payload.root,
-        quality=payload.quality,
-        scale_mode=payload.scale_mode,
-        highlight_scale=payload.highlight_scale,
-        show_all_scale=payload.show_all_scale,
-        width=payload.width,
-        height=payload.height,
-    )
 
-    if payload.output == "svg":
-        return Response(content=svg, media_type="image/svg+xml")
+@app.post("/render/triads/batch", tags=["default"])
+def render_triads_batch(payload: BatchPayload, Authorization: Optional[str] = Header(None)):
+    check_auth(Authorization)
 
-    if payload.output == "png":
+    results = []
+    for i, item in enumerate(payload.items):
+        if item.output == "png":
+            raise HTTPException(400, f"items[{i}]: batch aceita apenas svg|ascii")
         try:
-            import cairosvg  # opcional
-        except Exception:
-            raise HTTPException(500, "PNG requer CairoSVG. Instale com: pip install cairosvg")
-        png_bytes = cairosvg.svg2png(
-            bytestring=svg.encode("utf-8"),
-            output_width=payload.width,
-            output_height=payload.height,
-        )
-        return Response(content=png_bytes, media_type="image/png")
-
-    raise HTTPException(400, "output inválido. Use: svg|png|ascii")
+            _, content = _render_cached(_canonical_payload(item))
+        except HTTPException as e:
+            raise HTTPException(e.status_code, f"items[{i}]: {e.detail}")
+        results.append(content.decode("utf-8") if isinstance(content, bytes) else content)
+    return {"ok": True, "results": results}
 
 
 # Execução local (opcional)
@@ -1,4 +1,6 @@
-from typing import List, Tuple, Dict, Optional, Set
+from functools import lru_cache
+from itertools import combinations
+from typing import List, Tuple, Dict, Optional, FrozenSet
 
 NOTES_SHARP = ["C","C#","D","D#","E","F","F#","G","G#","A","A#","B"]
 ENH_EQ = {"Db":"C#", "Eb":"D#", "Gb":"F#", "Ab":"G#", "Bb":"A#"}
@@ -18,10 +20,18 @@ MODES = {
 }
 
 QUALITY_INTERVALS = {
-    "maj": [0,4,7],
-    "min": [0,3,7],
-    "dim": [0,3,6],
-    "aug": [0,4,8],
+    "maj": (0,4,7),
+    "min": (0,3,7),
+    "dim": (0,3,6),
+    "aug": (0,4,8),
+}
+
+TETRAD_INTERVALS = {
+    "maj7": (0, 4, 7, 11),
+    "min7": (0, 3, 7, 10),
+    "7":    (0, 4, 7, 10),   # dominante
+    "m7b5": (0, 3, 6, 10),   # meio-diminuto (ø)
+    "dim7": (0, 3, 6, 9),    # diminuto
 }
 
 DEFAULT_SCALE_FOR_QUALITY = {
@@ -29,11 +39,18 @@ DEFAULT_SCALE_FOR_QUALITY = {
     "min": "aeolian",
     "dim": "locrian",
     "aug": "ionian",
+    "maj7": "ionian",
+    "min7": "dorian",
+    "7":    "mixolydian",
+    "m7b5": "locrian",
+    "dim7": "locrian",   # sem escala diminuta em MODES; locrian traz b3 e b5
 }
 
+@lru_cache(maxsize=256)
 def norm_note(n: str) -> str:
     return ENH_EQ.get(n, n).upper()
 
+@lru_cache(maxsize=256)
 def note_to_idx(n: str) -> int:
     return NOTES_SHARP.index(norm_note(n))
 
@@ -43,20 +60,54 @@ def idx_to_note(i: int) -> str:
 def add_int(idx: int, semitones: int) -> int:
     return (idx + semitones) % 12
 
+# tabela traste→nota por corda (frets 0..24), montada uma vez no import
+FRET_COUNT = 25
+FRET_PC = tuple((OPEN_IDX[s] + f) % 12 for s in range(6) for f in range(FRET_COUNT))
+FRET_NOTE = tuple(NOTES_SHARP[p] for p in FRET_PC)
+
+# a tabela é plana: fora da faixa o índice cairia na linha de outra corda
+def _fret_index(string_num: int, fret: int) -> int:
+    if not 1 <= string_num <= 6:
+        raise ValueError(f"corda {string_num} fora de 1..6")
+    if not 0 <= fret < FRET_COUNT:
+        raise ValueError(f"traste {fret} fora de 0..{FRET_COUNT-1}")
+    return (string_num-1)*FRET_COUNT + fret
+
 def string_note_at_fret(string_num: int, fret: int) -> str:
-    base = OPEN_IDX[string_num-1]
-    return idx_to_note(base + fret)
+    return FRET_NOTE[_fret_index(string_num, fret)]
+
+def string_pc_at_fret(string_num: int, fret: int) -> int:
+    return FRET_PC[_fret_index(string_num, fret)]
+
+# janela de 7 casas (start_fret..start_fret+6) precisa caber na tabela
+MAX_START_FRET = FRET_COUNT - 7   # 18
 
-def triad_pitches(root: str, quality: str, inversion: int=0) -> List[int]:
+def check_start_fret(start_fret: int) -> None:
+    if not 0 <= start_fret <= MAX_START_FRET:
+        raise ValueError(f"start_fret {start_fret} fora de 0..{MAX_START_FRET}")
+
+# grupo de cordas (qualquer ordem) → tupla ordenada, para 3 e 4 vozes
+SORTED_STRINGS = {
+    frozenset(t): t for k in (3, 4) for t in combinations(range(1, 7), k)
+}
+
+def sorted_strings(strings) -> Tuple[int, ...]:
+    s_sorted = SORTED_STRINGS.get(frozenset(strings))
+    if s_sorted is None or len(s_sorted) != len(strings):
+        raise ValueError("strings deve ter cordas distintas entre 1 e 6")
+    return s_sorted
+
+@lru_cache(maxsize=256)
+def triad_pitches(root: str, quality: str, inversion: int=0) -> Tuple[int, ...]:
     root_idx = note_to_idx(root)
     ints = QUALITY_INTERVALS[quality]
-    pcs = [(root_idx + x) % 12 for x in ints]
+    pcs = tuple((root_idx + x) % 12 for x in ints)
     for _ in range(inversion % 3):
         pcs = pcs[1:] + pcs[:1]
     return pcs
 
-def assign_to_strings(pcs: List[int], strings: Tuple[int,int,int], order_top_to_bottom=True):
-    s_sorted = tuple(sorted(strings))
+def assign_to_strings(pcs: Tuple[int, ...], strings: Tuple[int,int,int], order_top_to_bottom=True):
+    s_sorted = sorted_strings(strings)
     seq = pcs[:] if order_top_to_bottom else list(reversed(pcs))
     return list(zip(s_sorted, seq))  # list of (string, pc)
 
@@ -68,150 +119,208 @@ def apply_spread(mapping, spread: Optional[str]):
     return mapping
 
 def choose_frets_for_mapping(mapping, start_fret: int) -> Dict[int,int]:
+    # primeiro traste >= start_fret com a pc pedida, direto por aritmética modular
     result = {}
-    lo, hi = start_fret, start_fret + 6
     for s, pc in mapping:
-        found = None
-        for t in range(lo, hi+1):
-            n = string_note_at_fret(s, t)
-            if note_to_idx(n) == pc:
-                found = t; break
-        if found is None:
-            raise ValueError(f"Sem posição para corda {s} na janela {lo}-{hi}.")
-        result[s] = found
+        offset = (pc - OPEN_IDX[s-1] - start_fret) % 12
+        if offset > 6:
+            raise ValueError(f"Sem posição para corda {s} na janela {start_fret}-{start_fret+6}.")
+        result[s] = start_fret + offset
     return result
 
-def scale_set(root: str, mode: Optional[str]) -> Set[str]:
+# máscaras de 12 bits (bit d = grau d acima da tônica)
+MODE_MASK = {m: sum(1 << d for d in degs) for m, degs in MODES.items()}
+QUALITY_MASK = {
+    q: sum(1 << d for d in ints)
+    for q, ints in (*QUALITY_INTERVALS.items(), *TETRAD_INTERVALS.items())
+}
+
+def rotate_mask(mask: int, root_pc: int) -> int:
+    # relativa à tônica → bit pc = pitch class absoluta
+    return ((mask << root_pc) | (mask >> (12 - root_pc))) & 0xFFF
+
+@lru_cache(maxsize=256)
+def scale_mask(root: str, mode: Optional[str]) -> int:
+    if mode is None:
+        mode = "ionian"
+    return rotate_mask(MODE_MASK[mode], note_to_idx(root))
+
+@lru_cache(maxsize=256)
+def chord_mask(root: str, quality: str) -> int:
+    return rotate_mask(QUALITY_MASK[quality], note_to_idx(root))
+
+def scale_set(root: str, mode: Optional[str]) -> FrozenSet[str]:
     if mode is None:
         mode = "ionian"
     r_idx = note_to_idx(root)
-    return { idx_to_note(r_idx + d) for d in MODES[mode] }
+    return frozenset(idx_to_note(r_idx + d) for d in MODES[mode])
 
-def generate_triad_voicing(root: str, quality: str, strings: Tuple[int,int,int], inversion: int, spread: Optional[str], start_fret: int) -> Dict[int,int]:
+# (corda, traste) de cada voz; a entrada é pequena e finita, então fica em cache
+@lru_cache(maxsize=1024)
+def _triad_frets(root: str, quality: str, strings: Tuple[int,int,int], inversion: int, spread: Optional[str], start_fret: int) -> Tuple[Tuple[int,int], ...]:
     pcs = triad_pitches(root, quality, inversion)
     mapping = assign_to_strings(pcs, strings, True)
     mapping = apply_spread(mapping, spread)
-    frets = choose_frets_for_mapping(mapping, start_fret)
+    return tuple(choose_frets_for_mapping(mapping, start_fret).items())
+
+def generate_triad_voicing(root: str, quality: str, strings: Tuple[int,int,int], inversion: int, spread: Optional[str], start_fret: int) -> Dict[int,int]:
+    frets = _triad_frets(root, quality, tuple(strings), inversion, spread, start_fret)
     voicing = { s: None for s in range(1,7) }
     voicing.update(frets)
     return voicing
 
 # ---------- ASCII (3-col grid) ----------
+# start_fret deve estar em 0..MAX_START_FRET (18); fora disso ValueError
+# células de largura fixa por pitch class (nota tocada / nota da escala)
+_CELL_NOTE = tuple(f" {NOTES_SHARP[pc][:2]:<2}|" for pc in range(12))
+_CELL_NOTE_LC = tuple(f" {NOTES_SHARP[pc][:2].lower():<2}|" for pc in range(12))
+_CELL_EMPTY = " . |"
+_CELL_MUTED = " X |"
+_ASCII_RULER = "    " + "  ".join(str(i) for i in range(0,7))
+
 def render_ascii_grid(voicing, start_fret, chord_root, quality, scale_mode, highlight_scale=True, show_all_scale=False):
+    check_start_fret(start_fret)
     lo = start_fret
-    scale = scale_set(chord_root, scale_mode or DEFAULT_SCALE_FOR_QUALITY[quality])
-    lines = []
+    scale_bits = scale_mask(chord_root, scale_mode or DEFAULT_SCALE_FOR_QUALITY[quality])
+    # globais usadas no laço viram locais (LOAD_FAST)
+    fret_pc, fret_count = FRET_PC, FRET_COUNT
+    cell_note, cell_note_lc = _CELL_NOTE, _CELL_NOTE_LC
+    out = []
+    a = out.append
     for s in range(1,7):
-        parts = []
         absf = voicing.get(s, None)
+        placed = isinstance(absf, int)
+        show_scale = highlight_scale and (show_all_scale or placed)
+        base = (s-1)*fret_count + lo
+        a(f"{s}|")
         for col in range(0,7):
-            fret = lo + col
-            note = string_note_at_fret(s, fret)
             if absf == "X" and col == 0:
-                parts.append(" X ")
+                a(_CELL_MUTED)
                 continue
-            if isinstance(absf, int) and absf == fret:
-                parts.append(f" {note[:2]:<2}")
+            pc = fret_pc[base + col]
+            if placed and absf == lo + col:
+                a(cell_note[pc])
+            elif show_scale and (scale_bits >> pc) & 1:
+                a(cell_note_lc[pc])
             else:
-                if highlight_scale and (show_all_scale or isinstance(absf,int)) and note in scale:
-                    parts.append(f" {note[:2].lower():<2}")
-                else:
-                    parts.append(" . ")
-        lines.append(f"{s}|" + "|".join(parts) + "|")
-    ruler = "    " + "  ".join(str(i) for i in range(0,7))
-    return "\n".join(lines+[ruler])
+                a(_CELL_EMPTY)
+        a("\n")
+    a(_ASCII_RULER)
+    return "".join(out)
 
 # ---------- SVG ----------
-def render_svg_fretboard(voicing, start_fret, chord_root, quality, scale_mode, highlight_scale, show_all_scale, width=420, height=520):
-    CELL_W, CELL_H = 45, 60
-    PADDING_L, PADDING_T = 70, 60
-    lo = start_fret
-    triad_pcs = triad_pitches(chord_root, quality, 0)
-    scale = scale_set(chord_root, scale_mode or DEFAULT_SCALE_FOR_QUALITY[quality])
+# o SVG é montado direto em bytes (sem .encode() no caminho do PNG)
+_SVG_HEAD = b"""<svg width="%(w)d" height="%(h)d" viewBox="0 0 %(w)d %(h)d" xmlns="http://www.w3.org/2000/svg">
+  <defs>
+    <style>
+      .nut{stroke:#111;stroke-width:8}
+      .fret{stroke:#666;stroke-width:2}
+      .string{stroke:#333;stroke-width:2}
+      .label{font:14px sans-serif;fill:#222}
+      .ruler{font:12px monospace;fill:#444}
+    </style>
+  </defs>
+  <rect x="0" y="0" width="%(w)d" height="%(h)d" fill="#fff"/>
+"""
+_SVG_STRING = b'  <line class="string" x1="%d" y1="%d" x2="%d" y2="%d" />\n'
+_SVG_FRET = b'  <line class="%s" x1="%d" y1="%d" x2="%d" y2="%d" />\n'
+_SVG_LABEL = b'  <text class="label" x="%d" y="%d" text-anchor="end">%d (%s)</text>\n'
+_SVG_RULER = b'  <text class="ruler" x="%d" y="%d" text-anchor="middle">%d</text>\n'
+_SVG_MARKER = (
+    b'  <g transform="translate(%s,%d)"><circle r="14" fill="%s" stroke="#222" stroke-width="%d" />'
+    b'<text x="0" y="4" text-anchor="middle" font-size="12" fill="%s" style="font-weight:%d">%s</text></g>\n'
+)
+_SVG_TAIL = b"</svg>"
 
-    def colX(c): return PADDING_L + c*CELL_W
-    def rowY(r): return PADDING_T + r*CELL_H
+# geometria fixa do diagrama
+CELL_W, CELL_H = 45, 60
+PADDING_L, PADDING_T = 70, 60
+_SVG_XS = tuple(PADDING_L + c*CELL_W for c in range(7))   # linha de cada traste
+_SVG_YS = tuple(PADDING_T + r*CELL_H for r in range(6))   # linha de cada corda
+_SVG_XS_MID = tuple(str(x + CELL_W/2).encode() for x in _SVG_XS)   # centro de cada casa
+_FRET_NOTE_B = tuple(n.encode() for n in FRET_NOTE)
+
+# parte estática (cordas, trastes, rótulos, régua): só depende da janela e do tamanho
+@lru_cache(maxsize=256)
+def _svg_skeleton(start_fret: int, width: int, height: int) -> Tuple[bytes, bytes]:
+    right = PADDING_L + CELL_W*7
+    top, bottom = PADDING_T - 6, PADDING_T + CELL_H*6 + 6
+
+    # sizes
+    w = max(PADDING_L + CELL_W*7 + 40, width)
+    h = max(PADDING_T + CELL_H*6 + 80, height)
+
+    parts = [_SVG_HEAD % {b"w": w, b"h": h}]
+    a = parts.append
 
     # strings & frets
-    strings_svg = "\n".join([f'<line class=\"string\" x1=\"{PADDING_L}\" y1=\"{rowY(r)}\" x2=\"{PADDING_L+CELL_W*7}\" y2=\"{rowY(r)}\" />' for r in range(6)])
-    frets = []
-    for c in range(0,7):
-        if c == 0:
-            frets.append(f'<line class=\"nut\" x1=\"{colX(c)}\" y1=\"{PADDING_T-6}\" x2=\"{colX(c)}\" y2=\"{PADDING_T+CELL_H*6+6}\" />')
-        else:
-            frets.append(f'<line class=\"fret\" x1=\"{colX(c)}\" y1=\"{PADDING_T-6}\" x2=\"{colX(c)}\" y2=\"{PADDING_T+CELL_H*6+6}\" />')
-    frets_svg = "\n".join(frets)
+    for y in _SVG_YS:
+        a(_SVG_STRING % (PADDING_L, y, right, y))
+    for c, x in enumerate(_SVG_XS):
+        a(_SVG_FRET % (b"nut" if c == 0 else b"fret", x, top, x, bottom))
 
     # labels & ruler
-    labels = "\n".join([f'<text class=\"label\" x=\"{PADDING_L-12}\" y=\"{rowY(i)+4}\" text-anchor=\"end\">{i+1} ({TUNING[i]})</text>' for i in range(6)])
-    ruler = "\n".join([f'<text class=\"ruler\" x=\"{colX(c)}\" y=\"{PADDING_T+CELL_H*6+30}\" text-anchor=\"middle\">{lo+c}</text>' for c in range(7)])
+    for i, y in enumerate(_SVG_YS):
+        a(_SVG_LABEL % (PADDING_L-12, y+4, i+1, TUNING[i].encode()))
+    ruler_y = PADDING_T + CELL_H*6 + 30
+    for c, x in enumerate(_SVG_XS):
+        a(_SVG_RULER % (x, ruler_y, start_fret+c))
 
-    # markers
-    markers = []
+    return b"".join(parts), _SVG_TAIL
+
+def _svg_markers(voicing, start_fret, chord_bits, scale_bits, highlight_scale, show_all_scale) -> bytes:
+    lo = start_fret
+    # globais usadas no laço viram locais (LOAD_FAST)
+    fret_note, fret_pc, fret_count = _FRET_NOTE_B, FRET_PC, FRET_COUNT
+    marker = _SVG_MARKER
+    xs = _SVG_XS_MID
+    ys = _SVG_YS
+    show_scale = show_all_scale and highlight_scale
+    parts = []
+    a = parts.append
     for s in range(1,7):
         absf = voicing.get(s, None)
-        for col in range(0,7):
-            fret = lo + col
-            note = string_note_at_fret(s, fret)
-            isPlaced = isinstance(absf, int) and absf == fret
-            isScale = (note in scale)
-            if isPlaced or (show_all_scale and highlight_scale and isScale):
-                x = colX(col) + CELL_W/2; y = rowY(s-1); r = 14
-                pc = triad_pcs
-                isChordTone = (note_to_idx(note) in pc)
-                fill = "#111" if isPlaced and isChordTone else ("#333" if isPlaced else "#2aa4f4")
-                textFill = "#fff" if isPlaced else "#001f3f"
-                stroke = "#222"
-                markers.append(
-                    f'<g transform=\"translate({x},{y})\"><circle r=\"{r}\" fill=\"{fill}\" stroke=\"{stroke}\" stroke-width=\"{2 if isPlaced else 1}\" />'
-                    f'<text x=\"0\" y=\"4\" text-anchor=\"middle\" font-size=\"12\" fill=\"{textFill}\" style=\"font-weight:{700 if isPlaced else 600}\">{note}</text></g>'
-                )
-    markers_svg = "\n".join(markers)
-
-    # sizes
-    w = PADDING_L + CELL_W*7 + 40
-    h = PADDING_T + CELL_H*6 + 80
-    w = max(w, width); h = max(h, height)
+        placed_col = absf - lo if isinstance(absf, int) and lo <= absf <= lo+6 else -1
+        # só visita as casas que podem gerar marcador
+        if show_scale:
+            cols = range(7)
+        elif placed_col >= 0:
+            cols = (placed_col,)
+        else:
+            continue
+        y = ys[s-1]
+        base = (s-1)*fret_count + lo
+        for col in cols:
+            pc = fret_pc[base + col]
+            if col == placed_col:
+                fill = b"#111" if (chord_bits >> pc) & 1 else b"#333"
+                a(marker % (xs[col], y, fill, 2, b"#fff", 700, fret_note[base + col]))
+            elif (scale_bits >> pc) & 1:
+                a(marker % (xs[col], y, b"#2aa4f4", 1, b"#001f3f", 600, fret_note[base + col]))
+    return b"".join(parts)
 
-    svg = f"""<svg width="{w}" height="{h}" viewBox="0 0 {w} {h}" xmlns="http://www.w3.org/2000/svg">
-  <defs>
-    <style>
-      .nut{{stroke:#111;stroke-width:8}}
-      .fret{{stroke:#666;stroke-width:2}}
-      .string{{stroke:#333;stroke-width:2}}
-      .label{{font:14px sans-serif;fill:#222}}
-      .ruler{{font:12px monospace;fill:#444}}
-    </style>
-  </defs>
-  <rect x="0" y="0" width="{w}" height="{h}" fill="#fff"/>
-  {strings_svg}
-  {frets_svg}
-  {labels}
-  {ruler}
-  {markers_svg}
-</svg>"""
-    return svg
+def render_svg_fretboard(voicing, start_fret, chord_root, quality, scale_mode, highlight_scale, show_all_scale, width=420, height=520):
+    # start_fret em 0..MAX_START_FRET (18), como no ASCII
+    check_start_fret(start_fret)
+    chord_bits = chord_mask(chord_root, quality)
+    scale_bits = scale_mask(chord_root, scale_mode or DEFAULT_SCALE_FOR_QUALITY[quality])
+    prefix, suffix = _svg_skeleton(start_fret, width, height)
+    markers = _svg_markers(voicing, start_fret, chord_bits, scale_bits, highlight_scale, show_all_scale)
+    return prefix + markers + suffix
 # --------- TÉTRADES ---------
-TETRAD_INTERVALS = {
-    "maj7": [0, 4, 7, 11],
-    "min7": [0, 3, 7, 10],
-    "7":    [0, 4, 7, 10],   # dominante
-    "m7b5": [0, 3, 6, 10],   # meio-diminuto (ø)
-    "dim7": [0, 3, 6, 9],    # diminuto
-}
-
+@lru_cache(maxsize=256)
 def tetrad_pitches(root: str, quality: str, inversion: int = 0):
     if quality not in TETRAD_INTERVALS:
         raise ValueError("quality deve ser: maj7|min7|7|m7b5|dim7")
     root_idx = note_to_idx(root)
     ints = TETRAD_INTERVALS[quality]
-    pcs = [(root_idx + x) % 12 for x in ints]  # [1,3,5,7]
+    pcs = tuple((root_idx + x) % 12 for x in ints)  # (1,3,5,7)
     for _ in range(inversion % 4):
         pcs = pcs[1:] + pcs[:1]
     return pcs  # 4 PCs
 
 def assign_to_strings_k(pcs, strings, order_top_to_bottom=True):
-    s_sorted = tuple(sorted(strings))
+    s_sorted = sorted_strings(strings)
     seq = pcs[:] if order_top_to_bottom else list(reversed(pcs))
     if len(seq) != len(s_sorted):
         raise ValueError("número de cordas deve = número de vozes")
@@ -235,12 +344,17 @@ def apply_spread_k(mapping, spread: str | None):
             return [V[0], V[1], V[3], V[2]]
     return mapping
 
-def generate_tetrad_voicing(root: str, quality: str, strings: tuple[int,int,int,int],
-                            inversion: int, spread: str | None, start_fret: int):
+@lru_cache(maxsize=1024)
+def _tetrad_frets(root: str, quality: str, strings: tuple[int,int,int,int],
+                  inversion: int, spread: str | None, start_fret: int):
     pcs = tetrad_pitches(root, quality, inversion)
     mapping = assign_to_strings_k(pcs, strings, True)
     mapping = apply_spread_k(mapping, spread)
-    frets = choose_frets_for_mapping(mapping, start_fret)
+    return tuple(choose_frets_for_mapping(mapping, start_fret).items())
+
+def generate_tetrad_voicing(root: str, quality: str, strings: tuple[int,int,int,int],
+                            inversion: int, spread: str | None, start_fret: int):
+    frets = _tetrad_frets(root, quality, tuple(strings), inversion, spread, start_fret)
     voicing = { s: None for s in range(1,7) }
     voicing.update(frets)
     return voicing